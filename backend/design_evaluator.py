@@ -1,21 +1,115 @@
 import os
 import logging
-import json
-import colorsys
-from typing import Dict, List
+import orjson
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+import numpy as np
+from cachetools import TTLCache
 from PIL import Image
-from openai import OpenAI
 
-# Pesos de puntuación simplificados
-SCORING_WEIGHTS = {
+# Pesos de puntuación simplificados (solo lectura)
+SCORING_WEIGHTS = MappingProxyType({
     'typography': 0.25,
     'color': 0.25,
     'layout': 0.25,
     'usability': 0.25
+})
+CATEGORIES = tuple(SCORING_WEIGHTS)
+CATEGORY_WEIGHTS = tuple(SCORING_WEIGHTS.values())
+
+# Evaluación de respaldo cuando falla el análisis; se comparte entre llamadas, es de solo lectura
+FALLBACK_EVALUATION = {
+    'total_score': 50.0,
+    'categories': {
+        'typography': {'score': 50.0, 'weight': SCORING_WEIGHTS['typography']},
+        'color': {'score': 50.0, 'weight': SCORING_WEIGHTS['color']},
+        'layout': {'score': 50.0, 'weight': SCORING_WEIGHTS['layout']},
+        'usability': {'score': 50.0, 'weight': SCORING_WEIGHTS['usability']}
+    },
+    'recommendations': ["No se pudo analizar completamente. Verifica la calidad de la imagen."],
+    'grade': "Regular"
 }
 
+# Límites inferiores de cada calificación (búsqueda con bisect)
+GRADE_THRESHOLDS = (50, 70, 85)
+GRADES = ("Necesita mejoras", "Regular", "Bueno", "Excelente")
+
+# Tramos de tamaño medio de fuente: (mínimo, máximo, puntos), del más estricto al más amplio
+FONT_SIZE_TIERS = ((14, 18, 20), (12, 20, 10))
+
+# Recomendaciones por categoría cuando el puntaje queda por debajo del umbral
+RECOMMENDATION_THRESHOLD = 70
+CATEGORY_RECOMMENDATIONS = (
+    "Mejora la legibilidad: usa tamaños de fuente entre 14-18px y asegura buen contraste.",
+    "Optimiza la paleta de colores: busca armonía y asegura accesibilidad (contraste mínimo 4.5:1).",
+    "Revisa el layout: utiliza mejor los espacios en blanco y asegura estructura clara.",
+    "Mejora la usabilidad: simplifica la navegación y agrega elementos interactivos claros."
+)
+
+# Modelo de OpenAI para la evaluación (la respuesta es un JSON pequeño)
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+
+# Prompt mejorado para evaluación de diseño web basado en conocimiento general
+EVALUATION_PROMPT = """
+            Evalúa el diseño del sitio web en la siguiente URL: %(page_url)s
+
+            IMPORTANTE: Como IA de texto, no puedo visitar URLs directamente, pero puedo proporcionar una evaluación basada en mi conocimiento general de buenas prácticas de diseño web y patrones comunes para este sitio específico.
+
+            Basándome en el conocimiento general de %(page_url)s, evalúa el diseño considerando las mejores prácticas estándar de diseño web para las siguientes categorías:
+
+            1. **Tipografía (Typography)**: Evalúa legibilidad, tamaño de fuente, jerarquía tipográfica, contraste y consistencia. Puntaje 0-100.
+
+            2. **Color**: Evalúa armonía de colores, accesibilidad (contraste), consistencia y uso apropiado. Puntaje 0-100.
+
+            3. **Layout**: Evalúa estructura, uso del espacio, proporciones, alineación y organización visual. Puntaje 0-100.
+
+            4. **Usabilidad**: Evalúa navegación, elementos interactivos, claridad de CTAs, y facilidad de uso. Puntaje 0-100.
+
+            INSTRUCCIONES CRÍTICAS:
+            - Debes proporcionar UNA evaluación específica basada en el conocimiento general del sitio web mencionado
+            - Los puntajes deben ser realistas y variados (no todos 85-90)
+            - Incluye al menos 3 recomendaciones específicas y accionables
+            - Responde ÚNICAMENTE con JSON válido, sin texto adicional antes o después
+
+            Respuesta JSON requerida (estructura exacta):
+            {
+                "typography": {"score": 75, "reasoning": "La tipografía es clara pero podría mejorar la jerarquía visual"},
+                "color": {"score": 82, "reasoning": "Los colores son armoniosos pero el contraste podría optimizarse"},
+                "layout": {"score": 78, "reasoning": "El layout es funcional pero podría usar mejor los espacios"},
+                "usability": {"score": 85, "reasoning": "La navegación es intuitiva con elementos interactivos claros"},
+                "recommendations": ["Mejorar el contraste de texto para accesibilidad", "Optimizar la jerarquía tipográfica", "Agregar más elementos visuales de navegación"]
+            }
+            """
+
+EVALUATION_SYSTEM_PROMPT = "Eres un experto evaluador de diseño web. Siempre respondes ÚNICAMENTE con JSON válido. Nunca incluyes texto adicional antes o después del JSON."
+
+# Tamaño máximo de la miniatura usada para el análisis de color
+COLOR_ANALYSIS_SIZE = (256, 256)
+
+# Caché de evaluaciones LLM por URL: tamaño máximo y vigencia en segundos
+EVALUATION_CACHE_SIZE = 1024
+EVALUATION_CACHE_TTL = 3600
+
 logger = logging.getLogger(__name__)
 
+@dataclass(slots=True)
+class CategoryScore:
+    """Puntaje de una categoría de diseño"""
+    score: float
+    weight: float
+    reasoning: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        """Convierte el puntaje al formato de la respuesta de la API"""
+        data = {'score': round(self.score, 1), 'weight': self.weight}
+        if self.reasoning is not None:
+            data['reasoning'] = self.reasoning
+        return data
+
 class DesignEvaluator:
     def __init__(self, credentials_path: str = None):
         """
@@ -36,6 +130,8 @@ class DesignEvaluator:
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
         if self.openai_api_key:
             try:
+                # Importar openai solo cuando hay API key: su importación tarda cientos de ms
+                from openai import OpenAI
                 self.openai_client = OpenAI(api_key=self.openai_api_key)
                 logger.info("OpenAI client inicializado correctamente")
             except Exception as e:
@@ -45,12 +141,17 @@ class DesignEvaluator:
             logger.warning("OPENAI_API_KEY no encontrada. Funcionalidad LLM limitada.")
             self.openai_client = None
 
-    def evaluate_design(self, page_url: str) -> dict:
+        # Caché de evaluaciones LLM por URL normalizada (LRU con expiración)
+        self._evaluation_cache = TTLCache(maxsize=EVALUATION_CACHE_SIZE, ttl=EVALUATION_CACHE_TTL)
+        self._cache_lock = threading.Lock()
+
+    def evaluate_design(self, page_url: str, bypass_cache: bool = False) -> dict:
         """
         Evalúa el diseño de un sitio web usando LLM
 
         Args:
             page_url (str): URL de la página web a evaluar
+            bypass_cache (bool): Si es True ignora la caché y vuelve a consultar al LLM
 
         Returns:
             Dict: Resultados de evaluación con puntajes y recomendaciones
@@ -58,7 +159,19 @@ class DesignEvaluator:
         try:
             # Si tenemos OpenAI, usar análisis LLM avanzado directamente
             if self.openai_client:
-                return self._evaluate_with_llm(page_url)
+                # El prompt depende solo de la URL: reutilizar evaluaciones previas
+                cache_key = self._normalize_url(page_url)
+                if not bypass_cache:
+                    with self._cache_lock:
+                        cached = self._evaluation_cache.get(cache_key)
+                    if cached is not None:
+                        logger.info(f"Evaluación obtenida de caché para: {page_url}")
+                        return cached
+
+                result = self._evaluate_with_llm(page_url)
+                with self._cache_lock:
+                    self._evaluation_cache[cache_key] = result
+                return result
             else:
                 # Fallback a evaluación básica (requiere screenshot)
                 logger.warning("Usando evaluación básica - OpenAI no disponible")
@@ -68,6 +181,13 @@ class DesignEvaluator:
             logger.error(f"Error evaluando diseño: {e}")
             return self._get_fallback_evaluation()
 
+    @staticmethod
+    def _normalize_url(page_url: str) -> str:
+        """Normaliza la URL para usarla como clave de caché"""
+        parts = urlsplit(page_url.strip())
+        path = parts.path.rstrip('/')
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ''))
+
     def _analyze_with_vision(self, image) -> dict:
         """Analiza la imagen con Google Cloud Vision"""
         if not self.client:
@@ -93,109 +213,39 @@ class DesignEvaluator:
     def _evaluate_with_llm(self, page_url: str) -> Dict:
         """Evalúa el diseño usando OpenAI API"""
         try:
-            # Prompt mejorado para evaluación de diseño web basado en conocimiento general
-            prompt = f"""
-            Evalúa el diseño del sitio web en la siguiente URL: {page_url}
-
-            IMPORTANTE: Como IA de texto, no puedo visitar URLs directamente, pero puedo proporcionar una evaluación basada en mi conocimiento general de buenas prácticas de diseño web y patrones comunes para este sitio específico.
-
-            Basándome en el conocimiento general de {page_url}, evalúa el diseño considerando las mejores prácticas estándar de diseño web para las siguientes categorías:
-
-            1. **Tipografía (Typography)**: Evalúa legibilidad, tamaño de fuente, jerarquía tipográfica, contraste y consistencia. Puntaje 0-100.
-
-            2. **Color**: Evalúa armonía de colores, accesibilidad (contraste), consistencia y uso apropiado. Puntaje 0-100.
-
-            3. **Layout**: Evalúa estructura, uso del espacio, proporciones, alineación y organización visual. Puntaje 0-100.
-
-            4. **Usabilidad**: Evalúa navegación, elementos interactivos, claridad de CTAs, y facilidad de uso. Puntaje 0-100.
-
-            INSTRUCCIONES CRÍTICAS:
-            - Debes proporcionar UNA evaluación específica basada en el conocimiento general del sitio web mencionado
-            - Los puntajes deben ser realistas y variados (no todos 85-90)
-            - Incluye al menos 3 recomendaciones específicas y accionables
-            - Responde ÚNICAMENTE con JSON válido, sin texto adicional antes o después
-
-            Respuesta JSON requerida (estructura exacta):
-            {{
-                "typography": {{"score": 75, "reasoning": "La tipografía es clara pero podría mejorar la jerarquía visual"}},
-                "color": {{"score": 82, "reasoning": "Los colores son armoniosos pero el contraste podría optimizarse"}},
-                "layout": {{"score": 78, "reasoning": "El layout es funcional pero podría usar mejor los espacios"}},
-                "usability": {{"score": 85, "reasoning": "La navegación es intuitiva con elementos interactivos claros"}},
-                "recommendations": ["Mejorar el contraste de texto para accesibilidad", "Optimizar la jerarquía tipográfica", "Agregar más elementos visuales de navegación"]
-            }}
-            """
+            prompt = EVALUATION_PROMPT % {'page_url': page_url}
 
             # Llamar a OpenAI (sin imagen, solo texto)
             response = self.openai_client.chat.completions.create(
-                model="gpt-4",
+                model=OPENAI_MODEL,
+                response_format={"type": "json_object"},
                 messages=[
                     {
                         "role": "system",
-                        "content": "Eres un experto evaluador de diseño web. Siempre respondes ÚNICAMENTE con JSON válido. Nunca incluyes texto adicional antes o después del JSON."
+                        "content": EVALUATION_SYSTEM_PROMPT
                     },
                     {
                         "role": "user",
                         "content": prompt
                     }
                 ],
-                max_tokens=1000,
+                max_tokens=400,
                 temperature=0.3
             )
 
-            # Parsear respuesta JSON
-            result_text = response.choices[0].message.content.strip()
-            logger.info(f"Respuesta cruda de OpenAI: {result_text}")
-
-            # Limpiar posibles caracteres markdown
-            if result_text.startswith('```json'):
-                result_text = result_text[7:]
-            if result_text.endswith('```'):
-                result_text = result_text[:-3]
-            result_text = result_text.strip()
-
-            logger.info(f"Respuesta limpia de OpenAI: {result_text}")
-            llm_result = json.loads(result_text)
-
-            # Calcular puntaje total ponderado
-            total_score = (
-                llm_result['typography']['score'] * SCORING_WEIGHTS['typography'] +
-                llm_result['color']['score'] * SCORING_WEIGHTS['color'] +
-                llm_result['layout']['score'] * SCORING_WEIGHTS['layout'] +
-                llm_result['usability']['score'] * SCORING_WEIGHTS['usability']
-            )
+            # Parsear respuesta JSON (el modo JSON garantiza un objeto sin markdown)
+            result_text = response.choices[0].message.content
+            logger.debug("Respuesta de OpenAI: %s", result_text)
+            llm_result = orjson.loads(result_text)
 
-            return {
-                'total_score': round(total_score, 1),
-                'categories': {
-                    'typography': {
-                        'score': round(llm_result['typography']['score'], 1),
-                        'weight': SCORING_WEIGHTS['typography'],
-                        'reasoning': llm_result['typography']['reasoning']
-                    },
-                    'color': {
-                        'score': round(llm_result['color']['score'], 1),
-                        'weight': SCORING_WEIGHTS['color'],
-                        'reasoning': llm_result['color']['reasoning']
-                    },
-                    'layout': {
-                        'score': round(llm_result['layout']['score'], 1),
-                        'weight': SCORING_WEIGHTS['layout'],
-                        'reasoning': llm_result['layout']['reasoning']
-                    },
-                    'usability': {
-                        'score': round(llm_result['usability']['score'], 1),
-                        'weight': SCORING_WEIGHTS['usability'],
-                        'reasoning': llm_result['usability']['reasoning']
-                    }
-                },
-                'recommendations': llm_result['recommendations'],
-                'grade': self._get_grade(total_score)
-            }
+            scores = [llm_result[category]['score'] for category in CATEGORIES]
+            reasonings = [llm_result[category]['reasoning'] for category in CATEGORIES]
+            return self._build_evaluation(scores, llm_result['recommendations'], reasonings)
 
         except Exception as e:
             logger.error(f"Error en evaluación LLM: {e}")
-            # Fallback a evaluación básica
-            return self._get_fallback_evaluation()
+            # evaluate_design usa la evaluación básica (sin guardarla en caché)
+            raise
 
     def _evaluate_basic(self, vision_results: dict, pil_image) -> dict:
         """Evaluación básica como fallback"""
@@ -205,39 +255,29 @@ class DesignEvaluator:
         layout_score = self._evaluate_layout(vision_results, pil_image)
         usability_score = self._evaluate_usability(vision_results)
 
-        # Calcular puntaje total ponderado
-        total_score = (
-            typography_score * SCORING_WEIGHTS['typography'] +
-            color_score * SCORING_WEIGHTS['color'] +
-            layout_score * SCORING_WEIGHTS['layout'] +
-            usability_score * SCORING_WEIGHTS['usability']
-        )
-
         # Generar recomendaciones
         recommendations = self._generate_recommendations(
             typography_score, color_score, layout_score, usability_score
         )
 
+        scores = [typography_score, color_score, layout_score, usability_score]
+        return self._build_evaluation(scores, recommendations)
+
+    def _build_evaluation(self, scores: List[float], recommendations: List[str],
+                          reasonings: List[str] = None) -> Dict:
+        """Arma el resultado de evaluación a partir de los puntajes en el orden de CATEGORIES"""
+        # Calcular puntaje total ponderado
+        total_score = sum(score * weight for score, weight in zip(scores, CATEGORY_WEIGHTS))
+
+        reasonings = reasonings or [None] * len(CATEGORIES)
+        categories = {
+            category: CategoryScore(score, weight, reasoning).to_dict()
+            for category, score, weight, reasoning in zip(CATEGORIES, scores, CATEGORY_WEIGHTS, reasonings)
+        }
+
         return {
             'total_score': round(total_score, 1),
-            'categories': {
-                'typography': {
-                    'score': round(typography_score, 1),
-                    'weight': SCORING_WEIGHTS['typography']
-                },
-                'color': {
-                    'score': round(color_score, 1),
-                    'weight': SCORING_WEIGHTS['color']
-                },
-                'layout': {
-                    'score': round(layout_score, 1),
-                    'weight': SCORING_WEIGHTS['layout']
-                },
-                'usability': {
-                    'score': round(usability_score, 1),
-                    'weight': SCORING_WEIGHTS['usability']
-                }
-            },
+            'categories': categories,
             'recommendations': recommendations,
             'grade': self._get_grade(total_score)
         }
@@ -250,20 +290,18 @@ class DesignEvaluator:
         if not texts:
             return score
 
-        # Analizar propiedades de texto
-        text_sizes = []
-        for text in texts[1:]:  # Saltar el primer elemento (texto completo)
-            bounds = text.bounding_poly.vertices
-            height = abs(bounds[2].y - bounds[0].y)
-            text_sizes.append(height)
-
-        if text_sizes:
-            avg_size = sum(text_sizes) / len(text_sizes)
+        # Analizar propiedades de texto: extraer las coordenadas y una sola vez
+        text_boxes = texts[1:]  # Saltar el primer elemento (texto completo)
+        if text_boxes:
+            ys = np.fromiter(
+                (y for text in text_boxes
+                 for y in (text.bounding_poly.vertices[2].y, text.bounding_poly.vertices[0].y)),
+                dtype=np.int32,
+                count=2 * len(text_boxes)
+            ).reshape(-1, 2)
+            avg_size = np.abs(ys[:, 0] - ys[:, 1]).mean()
             # Verificar tamaño de fuente (asumiendo resolución típica)
-            if 14 <= avg_size <= 18:
-                score += 20
-            elif 12 <= avg_size <= 20:
-                score += 10
+            score += next((points for low, high, points in FONT_SIZE_TIERS if low <= avg_size <= high), 0)
 
         # Simular evaluación de contraste (en implementación real necesitaríamos OCR más avanzado)
         score += 15  # Contraste asumido aceptable
@@ -273,23 +311,32 @@ class DesignEvaluator:
     def _evaluate_color(self, pil_image: Image) -> float:
         """Evalúa el uso del color"""
         try:
-            # Obtener colores dominantes
-            colors = pil_image.getcolors(pil_image.size[0] * pil_image.size[1])
-            if not colors:
+            if pil_image.size[0] * pil_image.size[1] == 0:
                 return 50
 
-            # Analizar paleta de colores
-            dominant_colors = sorted(colors, key=lambda x: x[0], reverse=True)[:10]
-
-            # Evaluar armonía básica (diversidad de colores)
-            unique_hues = set()
-            for count, color in dominant_colors:
-                if isinstance(color, (tuple, list)) and len(color) >= 3:
-                    r, g, b = color[:3]
-                    h, s, v = colorsys.rgb_to_hsv(r/255, g/255, b/255)
-                    unique_hues.add(round(h * 360))  # Convertir a grados
-
-            harmony_score = min(30, len(unique_hues) * 3)
+            # Evaluar armonía básica (diversidad de colores); imágenes sin canales RGB no aportan tonos
+            unique_hues = 0
+            if len(pil_image.getbands()) >= 3:
+                # Los colores dominantes no cambian al reducir la imagen: analizar una miniatura.
+                # resize con reducing_gap reduce primero por bloques y evita copiar la original
+                width, height = pil_image.size
+                scale = min(1.0, COLOR_ANALYSIS_SIZE[0] / width, COLOR_ANALYSIS_SIZE[1] / height)
+                small_image = pil_image.resize(
+                    (max(1, round(width * scale)), max(1, round(height * scale))),
+                    Image.BILINEAR,
+                    reducing_gap=2.0
+                )
+
+                # Obtener colores dominantes con la cuantización de Pillow (median cut, en C)
+                quantized = small_image.convert('RGB').quantize(colors=16, method=Image.Quantize.MEDIANCUT)
+                palette = np.asarray(quantized.getpalette(), dtype=np.float64).reshape(-1, 3) / 255.0
+
+                # Analizar paleta de colores: los 10 más frecuentes
+                dominant_colors = sorted(quantized.getcolors(16), key=lambda x: x[0], reverse=True)[:10]
+                indices = [index for count, index in dominant_colors]
+                unique_hues = len(np.unique(self._hue_degrees(palette[indices])))
+
+            harmony_score = min(30, unique_hues * 3)
 
             # Evaluar accesibilidad básica (contraste)
             accessibility_score = 25  # Asumido básico
@@ -303,6 +350,22 @@ class DesignEvaluator:
             logger.error(f"Error evaluando color: {e}")
             return 50
 
+    @staticmethod
+    def _hue_degrees(rgb: np.ndarray) -> np.ndarray:
+        """Calcula el tono en grados de un array (N, 3) RGB en [0, 1], igual que colorsys.rgb_to_hsv"""
+        r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+        maxc = rgb.max(axis=1)
+        delta = maxc - rgb.min(axis=1)
+        safe_delta = np.where(delta == 0, 1.0, delta)
+
+        rc = (maxc - r) / safe_delta
+        gc = (maxc - g) / safe_delta
+        bc = (maxc - b) / safe_delta
+        hue = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+        hue = np.where(delta == 0, 0.0, (hue / 6.0) % 1.0)
+
+        return np.round(hue * 360)  # Convertir a grados
+
     def _evaluate_layout(self, vision_results: Dict, pil_image: Image) -> float:
         """Evalúa el layout y estructura"""
         score = 60  # Puntaje base
@@ -352,14 +415,10 @@ class DesignEvaluator:
         """Genera recomendaciones basadas en los puntajes"""
         recommendations = []
 
-        if typography < 70:
-            recommendations.append("Mejora la legibilidad: usa tamaños de fuente entre 14-18px y asegura buen contraste.")
-        if color < 70:
-            recommendations.append("Optimiza la paleta de colores: busca armonía y asegura accesibilidad (contraste mínimo 4.5:1).")
-        if layout < 70:
-            recommendations.append("Revisa el layout: utiliza mejor los espacios en blanco y asegura estructura clara.")
-        if usability < 70:
-            recommendations.append("Mejora la usabilidad: simplifica la navegación y agrega elementos interactivos claros.")
+        scores = (typography, color, layout, usability)
+        for score, recommendation in zip(scores, CATEGORY_RECOMMENDATIONS):
+            if score < RECOMMENDATION_THRESHOLD:
+                recommendations.append(recommendation)
 
         if not recommendations:
             recommendations.append("¡Excelente trabajo! Tu sitio tiene un diseño muy sólido.")
@@ -368,25 +427,8 @@ class DesignEvaluator:
 
     def _get_grade(self, score: float) -> str:
         """Convierte puntaje numérico a calificación cualitativa"""
-        if score >= 85:
-            return "Excelente"
-        elif score >= 70:
-            return "Bueno"
-        elif score >= 50:
-            return "Regular"
-        else:
-            return "Necesita mejoras"
+        return GRADES[bisect_right(GRADE_THRESHOLDS, score)]
 
     def _get_fallback_evaluation(self) -> Dict:
-        """Evaluación de respaldo cuando falla el análisis"""
-        return {
-            'total_score': 50.0,
-            'categories': {
-                'typography': {'score': 50.0, 'weight': SCORING_WEIGHTS['typography']},
-                'color': {'score': 50.0, 'weight': SCORING_WEIGHTS['color']},
-                'layout': {'score': 50.0, 'weight': SCORING_WEIGHTS['layout']},
-                'usability': {'score': 50.0, 'weight': SCORING_WEIGHTS['usability']}
-            },
-            'recommendations': ["No se pudo analizar completamente. Verifica la calidad de la imagen."],
-            'grade': "Regular"
-        }
\ No newline at end of file
+        """Evaluación de respaldo cuando falla el análisis (compartida: no modificar)"""
+        return FALLBACK_EVALUATION
\ No newline at end of file
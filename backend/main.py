@@ -1,87 +1,236 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, HttpUrl
+from fastapi.responses import FileResponse, ORJSONResponse
+from pydantic import BaseModel, ConfigDict, HttpUrl
 import logging
+import asyncio
+import math
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from collections import OrderedDict
 from typing import Optional
 import os
-import requests
+import httpx
 import base64
+import orjson
+import io
+from PIL import Image
 
 from .screenshot_capture import ScreenshotCapture
-from .design_evaluator import DesignEvaluator
+from .design_evaluator import CATEGORIES, DesignEvaluator
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Herramienta de Evaluación de Diseño Web", version="1.0.0")
+# Respuestas JSON serializadas con orjson
+app = FastAPI(
+    title="Herramienta de Evaluación de Diseño Web",
+    version="1.0.0",
+    default_response_class=ORJSONResponse
+)
+
+# Configurar CORS: orígenes separados por comas en FRONTEND_ORIGINS (en
+# producción, especificar los orígenes permitidos en vez de "*")
+FRONTEND_ORIGINS = [origin.strip() for origin in os.getenv('FRONTEND_ORIGINS', '*').split(',') if origin.strip()]
 
-# Configurar CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # En producción, especificar orígenes permitidos
+    allow_origins=FRONTEND_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
+    max_age=86400,  # Los navegadores cachean el preflight 24 h
 )
 
-# Modelos Pydantic
+# Modelos Pydantic (v2, inmutables: se crean una vez por petición y no se modifican)
 class EvaluationRequest(BaseModel):
-    url: HttpUrl
+    model_config = ConfigDict(frozen=True)
+
+    url: HttpUrl  # Solo acepta esquemas http y https
 
 class EvaluationResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     url: str
     total_score: float
     grade: str
     categories: dict
     recommendations: list
     screenshot_url: Optional[str] = None
+    evaluation_id: Optional[str] = None
 
 # Instancias de servicios (se inicializarán cuando sea necesario)
 screenshot_capture = None
+# Hilos propios de las capturas, tantos como Chrome en el pool: una captura que
+# espera un Chrome libre no ocupa un hilo del executor compartido
+capture_executor = None
 design_evaluator = None
+sheets_logger = None
+
+# Respuesta de /api/health, calculada al inicializar los servicios
+health_payload = None
+
+# URL del Apps Script (se lee una sola vez del .env al iniciar los servicios);
+# sin ella no se suben screenshots a Drive ni se registra en Sheets
+APPS_SCRIPT_URL = None
+
+# Captura de screenshots activable por entorno (ENABLE_SCREENSHOTS=false la omite)
+ENABLE_SCREENSHOTS = os.getenv('ENABLE_SCREENSHOTS', 'true').lower() in ('1', 'true', 'yes')
+
+# Subidas en curso por evaluation_id, para consultar su estado (las más antiguas se descartan)
+pending_uploads = OrderedDict()
+MAX_PENDING_UPLOADS = 1024
+
+# Registros en Sheets que esperan a su subida; el cierre los espera antes de
+# cerrar el lote para no perder filas
+pending_registrations = set()
+
+# Segundos que la respuesta espera a la subida (que ya corre en paralelo con la
+# evaluación) para incluir screenshot_url; si tarda más se consulta por evaluation_id
+SCREENSHOT_RESPONSE_WAIT = 15
+
+# Reintentos ante errores transitorios del Apps Script. doPost no es idempotente:
+# solo se reintenta lo que seguro no llegó a ejecutarse (fallos de conexión y
+# rechazos del frontend de Google), nunca timeouts de lectura ni 500, que suelen
+# significar que el script ya corrió
+APPS_SCRIPT_RETRY_STATUSES = frozenset([429, 502, 503, 504])
+APPS_SCRIPT_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+APPS_SCRIPT_MAX_ATTEMPTS = 3
+APPS_SCRIPT_BACKOFF_FACTOR = 0.25
+
+# Cliente HTTP/2 asíncrono para subidas y registros en Sheets desde el event
+# loop: las peticiones concurrentes comparten una conexión (se crea en el startup)
+apps_script_client = None
+
+# Hilos para el resto del trabajo bloqueante (OpenAI, compresión de imágenes)
+BLOCKING_WORKERS = 16
+
+# Lotes de filas para Sheets: hasta SHEETS_MAX_BATCH filas o SHEETS_MAX_WAIT segundos
+SHEETS_MAX_BATCH = 25
+SHEETS_MAX_WAIT = 2.0
+
+# Timeouts por intento de cada POST al Apps Script (segundos)
+SHEETS_POST_TIMEOUT = 10
+UPLOAD_POST_TIMEOUT = 30
+
+def apps_script_retry_budget(timeout):
+    """
+    Tiempo máximo que puede tardar post_to_apps_script con todos sus reintentos
+
+    Args:
+        timeout: Timeout de cada intento (segundos)
+    """
+    backoff = sum(APPS_SCRIPT_BACKOFF_FACTOR * 2 ** attempt for attempt in range(APPS_SCRIPT_MAX_ATTEMPTS - 1))
+    return APPS_SCRIPT_MAX_ATTEMPTS * timeout + backoff
+
+class Base64Body:
+    """
+    Cuerpo de petición que codifica a base64 por bloques mientras se envía,
+    sin materializar la imagen codificada completa en memoria
+    """
+
+    # Múltiplo de 3 para que cada bloque se codifique sin padding intermedio
+    CHUNK_SIZE = 57 * 1024
+
+    def __init__(self, data):
+        self._view = memoryview(data)
+
+    def __len__(self):
+        # Longitud codificada, para enviar Content-Length en vez de chunked
+        return 4 * ((len(self._view) + 2) // 3)
+
+    async def __aiter__(self):
+        for start in range(0, len(self._view), self.CHUNK_SIZE):
+            yield base64.b64encode(self._view[start:start + self.CHUNK_SIZE])
+
+# Tamaño máximo de la vista previa subida a Drive (ancho, alto)
+PREVIEW_MAX_SIZE = (1280, 4096)
+PREVIEW_JPEG_QUALITY = 82
 
-def upload_screenshot_to_drive(screenshot_data):
+def compress_screenshot(screenshot_data):
+    """
+    Reduce el screenshot a una vista previa JPEG para subirlo a Drive
+
+    Args:
+        screenshot_data: Bytes del screenshot (JPEG o PNG)
+
+    Returns:
+        bytes: Datos de la imagen en formato JPEG
+    """
+    image = Image.open(io.BytesIO(screenshot_data))
+    image.thumbnail(PREVIEW_MAX_SIZE, Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.convert('RGB').save(buffer, 'JPEG', quality=PREVIEW_JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+async def post_to_apps_script(**kwargs):
+    """
+    Envía un POST al Apps Script con el cliente asíncrono, reintentando con
+    backoff corto solo los errores en los que el POST no llegó a ejecutarse
+
+    Returns:
+        httpx.Response: Respuesta final del Apps Script
+    """
+    last_attempt = APPS_SCRIPT_MAX_ATTEMPTS - 1
+    for attempt in range(APPS_SCRIPT_MAX_ATTEMPTS):
+        try:
+            response = await apps_script_client.post(APPS_SCRIPT_URL, **kwargs)
+            # Con historial, el estado es del GET del redirect: el POST ya se ejecutó
+            if (response.history or response.status_code not in APPS_SCRIPT_RETRY_STATUSES
+                    or attempt == last_attempt):
+                return response
+            logger.warning(f"Apps Script respondió {response.status_code}, reintentando...")
+        except APPS_SCRIPT_RETRY_ERRORS as e:
+            # Si falla la petición del redirect (GET del resultado), el POST ya se ejecutó
+            if attempt == last_attempt or e.request.method != 'POST':
+                raise
+            logger.warning(f"Error de conexión con Apps Script ({e}), reintentando...")
+
+        await asyncio.sleep(APPS_SCRIPT_BACKOFF_FACTOR * 2 ** attempt)
+
+async def upload_screenshot_to_drive(screenshot_data, preview=True):
     """
     Sube un screenshot a Google Drive usando Apps Script
 
     Args:
         screenshot_data: Bytes del screenshot
+        preview: Si es True sube una vista previa JPEG reducida en vez de la captura original
 
     Returns:
         str: URL del archivo subido en Google Drive
     """
     try:
-        # URL del Apps Script (debe estar configurada en el .env)
-        apps_script_url = os.getenv('GOOGLE_APPS_SCRIPT_URL')
-        logger.info(f"Usando Apps Script URL: {apps_script_url}")
-
-        # Convertir bytes a base64
-        base64_data = base64.b64encode(screenshot_data).decode('utf-8')
-        data_url = f"data:image/png;base64,{base64_data}"
-        logger.info(f"Imagen base64 preparada, tamaño: {len(base64_data)} caracteres")
-
-        # Preparar payload para Apps Script
-        payload = {
-            'image_base64': data_url
-        }
-
-        # Enviar POST al Apps Script
+        # Las capturas llegan en JPEG; PNG queda para capturas de otras fuentes
+        mime_type = 'image/jpeg' if screenshot_data[:2] == b'\xff\xd8' else 'image/png'
+        if preview:
+            original_size = len(screenshot_data)
+            screenshot_data = await asyncio.to_thread(compress_screenshot, screenshot_data)
+            mime_type = 'image/jpeg'
+            logger.info(f"Vista previa generada: {original_size} -> {len(screenshot_data)} bytes")
+
+        # Apps Script no puede leer cuerpos binarios, así que se envía base64
+        # como texto plano, codificado por bloques durante el envío
+        body = Base64Body(screenshot_data)
+        logger.info(f"Imagen base64 preparada, tamaño: {len(body)} bytes")
+
+        # Enviar POST al Apps Script (el tipo MIME va en la query string)
         logger.info("Enviando solicitud POST al Apps Script...")
-        response = requests.post(
-            apps_script_url,
-            json=payload,
-            headers={'Content-Type': 'application/json'},
-            timeout=30
+        response = await post_to_apps_script(
+            params={'mime_type': mime_type},
+            content=body,
+            headers={'Content-Type': 'text/plain', 'Content-Length': str(len(body))},
+            timeout=UPLOAD_POST_TIMEOUT
         )
 
         logger.info(f"Respuesta del Apps Script - Status: {response.status_code}")
         response.raise_for_status()
 
         result = response.json()
-        logger.info(f"Respuesta JSON del Apps Script: {result}")
+        logger.debug("Respuesta JSON del Apps Script: %s", result)
 
         if not result.get('success'):
             raise Exception(f"Apps Script error: {result.get('error', 'Unknown error')}")
@@ -91,84 +240,244 @@ def upload_screenshot_to_drive(screenshot_data):
         return screenshot_url
 
     except Exception as e:
-        logger.error(f"Error subiendo screenshot a Drive: {e}")
-        import traceback
-        logger.error(f"Traceback completo: {traceback.format_exc()}")
+        logger.exception(f"Error subiendo screenshot a Drive: {e}")
         raise
 
-def register_evaluation_in_sheets(url, evaluation_data, screenshot_url):
+def build_sheets_row(url, evaluation_data, screenshot_url):
     """
-    Registra la evaluación en Google Sheets usando Apps Script
+    Prepara el payload de una evaluación para registrarla en Sheets
 
     Args:
         url: URL evaluada
         evaluation_data: Datos de la evaluación
         screenshot_url: URL del screenshot (opcional)
+
+    Returns:
+        dict: Fila con el formato que espera el Apps Script
+    """
+    recommendations = evaluation_data.get('recommendations', [])
+    if not isinstance(recommendations, list):
+        recommendations = [str(recommendations)]
+
+    row = {
+        # Marcar la hora de la evaluación, no la del envío (las filas pueden enviarse en lote)
+        'timestamp': evaluation_data.get('timestamp') or datetime.now(timezone.utc).isoformat(),
+        'url': url,
+        'total_score': evaluation_data['total_score'],
+        'grade': evaluation_data['grade']
+    }
+
+    # Una columna <categoría>_score por cada categoría de SCORING_WEIGHTS
+    categories = evaluation_data.get('categories', {})
+    for category in CATEGORIES:
+        row[f'{category}_score'] = categories.get(category, {}).get('score', 0)
+
+    row['screenshot_url'] = screenshot_url or ''
+    row['recommendations'] = recommendations
+    return row
+
+async def post_to_sheets(payload):
+    """
+    Envía al Apps Script una fila o un lote de filas ({'rows': [...]})
+
+    Args:
+        payload: Datos a registrar en Sheets
     """
     try:
-        # URL del Apps Script (debe estar configurada en el .env)
-        apps_script_url = os.getenv('GOOGLE_APPS_SCRIPT_URL')
-        logger.info(f"Registrando evaluación en Sheets usando URL: {apps_script_url}")
-
-        # Preparar payload para registro en Sheets
-        recommendations = evaluation_data.get('recommendations', [])
-        if not isinstance(recommendations, list):
-            recommendations = [str(recommendations)]
-
-        payload = {
-            'timestamp': evaluation_data.get('timestamp', '2025-01-01T12:00:00Z'),
-            'url': url,
-            'total_score': evaluation_data['total_score'],
-            'grade': evaluation_data['grade'],
-            'typography_score': evaluation_data.get('categories', {}).get('typography', {}).get('score', 0),
-            'color_score': evaluation_data.get('categories', {}).get('color', {}).get('score', 0),
-            'layout_score': evaluation_data.get('categories', {}).get('layout', {}).get('score', 0),
-            'usability_score': evaluation_data.get('categories', {}).get('usability', {}).get('score', 0),
-            'screenshot_url': screenshot_url or '',
-            'recommendations': recommendations
-        }
-
-        logger.info(f"Payload para Sheets: {payload}")
-
-        # Enviar POST al Apps Script
-        response = requests.post(
-            apps_script_url,
-            json=payload,
+        logger.debug("Payload para Sheets: %s", payload)
+
+        # Enviar POST al Apps Script (serializado con orjson)
+        response = await post_to_apps_script(
+            content=orjson.dumps(payload),
             headers={'Content-Type': 'application/json'},
-            timeout=10
+            timeout=SHEETS_POST_TIMEOUT
         )
 
         logger.info(f"Respuesta Sheets - Status: {response.status_code}")
         response.raise_for_status()
 
         result = response.json()
-        logger.info(f"Respuesta JSON Sheets: {result}")
+        logger.debug("Respuesta JSON Sheets: %s", result)
 
         if not result.get('success'):
             raise Exception(f"Apps Script error: {result.get('error', 'Unknown error')}")
 
     except Exception as e:
-        logger.error(f"Error registrando en Sheets: {e}")
-        import traceback
-        logger.error(f"Traceback completo: {traceback.format_exc()}")
+        logger.exception(f"Error registrando en Sheets: {e}")
         raise
 
+class SheetsBatchLogger:
+    """
+    Acumula filas de evaluaciones en una cola asíncrona y las envía a Sheets
+    en una sola llamada al Apps Script, cada max_batch filas o cada max_wait segundos
+    """
+
+    def __init__(self, max_batch=SHEETS_MAX_BATCH, max_wait=SHEETS_MAX_WAIT):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._closing = False
+        # Filas del lote que se está enviando (para contar las perdidas si se corta)
+        self._in_flight = 0
+
+    def start(self):
+        """Arranca el consumidor de la cola (debe llamarse dentro del event loop)"""
+        self._task = asyncio.create_task(self._consume())
+
+    def log(self, row):
+        """
+        Encola una fila para el próximo lote
+
+        Args:
+            row: Fila generada con build_sheets_row
+
+        Returns:
+            bool: False si el logger ya se está cerrando y la fila no se encoló
+        """
+        if self._closing:
+            return False
+        self._queue.put_nowait(row)
+        return True
+
+    async def close(self):
+        """Envía las filas pendientes y detiene el consumidor"""
+        if self._task is None or self._closing:
+            return
+        self._closing = True
+
+        # Margen para el lote en curso más los que quedan en cola, cada uno con
+        # todos sus reintentos
+        batches = 1 + math.ceil(self._queue.qsize() / self.max_batch)
+        timeout = self.max_wait + batches * apps_script_retry_budget(SHEETS_POST_TIMEOUT)
+        self._queue.put_nowait(None)
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            lost = self._in_flight + sum(1 for row in self._drain() if row is not None)
+            logger.error(f"Tiempo agotado ({timeout:.0f}s) enviando las últimas filas a Sheets: {lost} filas perdidas")
+
+    def _drain(self):
+        """Vacía la cola y devuelve lo que quedaba en ella"""
+        rows = []
+        while not self._queue.empty():
+            rows.append(self._queue.get_nowait())
+        return rows
+
+    async def _consume(self):
+        """Consumidor: agrupa filas hasta completar el lote o agotar la espera"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            row = await self._queue.get()
+            if row is None:
+                break
+
+            batch = [row]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            self._in_flight = len(batch)
+            try:
+                logger.info(f"Enviando lote de {len(batch)} evaluaciones a Sheets...")
+                await post_to_sheets({'rows': batch})
+            except Exception as e:
+                logger.error(f"Error enviando lote a Sheets ({len(batch)} filas perdidas): {e}")
+            self._in_flight = 0
+
+async def register_when_uploaded(url, evaluation_data, upload_task):
+    """
+    Encola la evaluación para Sheets una vez terminada la subida del screenshot
+
+    Args:
+        url: URL evaluada
+        evaluation_data: Datos de la evaluación
+        upload_task: Tarea de upload_screenshot_to_drive (None sin screenshot)
+    """
+    # Si la subida falló ya quedó registrado el error; se registra sin screenshot
+    screenshot_url = None
+    if upload_task:
+        try:
+            screenshot_url = await upload_task
+        except Exception:
+            pass
+    row = build_sheets_row(url, evaluation_data, screenshot_url)
+
+    try:
+        if sheets_logger and sheets_logger.log(row):
+            logger.info("Evaluación encolada para registro en Sheets")
+        else:
+            # Sin logger de lotes, o ya cerrándose: envío directo
+            await post_to_sheets(row)
+            logger.info("Evaluación registrada exitosamente en Sheets")
+    except Exception as e:
+        logger.error(f"Error registrando en Sheets: {e}")
+
+def build_health_payload():
+    """
+    Calcula el estado de salud a partir de los servicios inicializados
+
+    Returns:
+        dict: Estado global y disponibilidad de cada servicio
+    """
+    services_status = {"design_evaluator": design_evaluator is not None}
+    # La captura solo cuenta si está activada (ENABLE_SCREENSHOTS y Apps Script configurado)
+    if ENABLE_SCREENSHOTS and APPS_SCRIPT_URL:
+        services_status["screenshot_capture"] = screenshot_capture is not None
+
+    return {
+        "status": "healthy" if all(services_status.values()) else "degraded",
+        "services": services_status
+    }
+
 def initialize_services():
     """Inicializa los servicios externos"""
-    global screenshot_capture, design_evaluator
+    global screenshot_capture, capture_executor, design_evaluator, sheets_logger, health_payload, APPS_SCRIPT_URL
+
+    # Sin Apps Script no hay subida a Drive ni registro en Sheets: se avisa
+    # una vez al arrancar y las peticiones omiten esos pasos
+    APPS_SCRIPT_URL = os.getenv('GOOGLE_APPS_SCRIPT_URL')
+    if APPS_SCRIPT_URL:
+        logger.info(f"Usando Apps Script URL: {APPS_SCRIPT_URL}")
+    else:
+        logger.error("GOOGLE_APPS_SCRIPT_URL no está configurada: se omiten Drive y Sheets")
 
     try:
-        screenshot_capture = ScreenshotCapture()
-        logger.info("Screenshot capture inicializado")
+        if APPS_SCRIPT_URL:
+            sheets_logger = SheetsBatchLogger()
+            sheets_logger.start()
+            logger.info("Registro en Sheets por lotes inicializado")
+
+        # Los screenshots solo se usan para subirlos a Drive
+        if ENABLE_SCREENSHOTS and APPS_SCRIPT_URL:
+            screenshot_capture = ScreenshotCapture()
+            capture_executor = ThreadPoolExecutor(
+                max_workers=screenshot_capture.pool_size, thread_name_prefix="capture"
+            )
+            logger.info("Screenshot capture inicializado")
+        else:
+            logger.info("Captura de screenshots desactivada")
 
         # Inicializar design_evaluator siempre (no depende de Google)
         design_evaluator = DesignEvaluator()
         logger.info(f"Design evaluator inicializado - OpenAI disponible: {design_evaluator.openai_client is not None}")
 
     except Exception as e:
-        logger.error(f"Error inicializando servicios: {e}")
-        import traceback
-        logger.error(f"Traceback inicialización: {traceback.format_exc()}")
+        logger.exception(f"Error inicializando servicios: {e}")
+
+    # Los servicios no cambian después del arranque: el estado de salud se calcula una vez
+    health_payload = build_health_payload()
 
 # Montar archivos estáticos del frontend
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -176,8 +485,38 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 @app.on_event("startup")
 async def startup_event():
     """Evento de inicio de la aplicación"""
+    global apps_script_client
+
+    # asyncio.to_thread usa el executor por defecto del loop
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+    )
+    apps_script_client = httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,  # /exec responde con un redirect a googleusercontent.com
+        timeout=30.0,
+        limits=httpx.Limits(max_keepalive_connections=20)
+    )
     initialize_services()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Evento de cierre: envía las evaluaciones pendientes de registrar y cierra Chrome"""
+    # Las evaluaciones cuya subida sigue en curso aún tienen que encolar su fila
+    if pending_registrations:
+        timeout = apps_script_retry_budget(UPLOAD_POST_TIMEOUT)
+        _, unfinished = await asyncio.wait(set(pending_registrations), timeout=timeout)
+        if unfinished:
+            logger.error(f"Tiempo agotado ({timeout:.0f}s) esperando subidas: {len(unfinished)} evaluaciones sin registrar en Sheets")
+    if sheets_logger:
+        await sheets_logger.close()
+    if screenshot_capture:
+        await asyncio.to_thread(screenshot_capture.close)
+    if capture_executor:
+        capture_executor.shutdown(wait=False)
+    if apps_script_client:
+        await apps_script_client.aclose()
+
 @app.get("/")
 async def root():
     """Servir el frontend React"""
@@ -198,50 +537,62 @@ async def evaluate_website(request: EvaluationRequest):
     url = str(request.url)
 
     try:
-        # Validar URL básica
-        if not url.startswith(('http://', 'https://')):
-            raise HTTPException(status_code=400, detail="URL debe comenzar con http:// o https://")
-
-        # Capturar screenshot
-        logger.info(f"Capturando screenshot de {url}")
-        screenshot_data = screenshot_capture.capture_screenshot(url)
-
-        # Subir screenshot a Google Drive usando Apps Script
-        screenshot_url = None
-        try:
-            logger.info("Subiendo screenshot a Google Drive...")
-            screenshot_url = upload_screenshot_to_drive(screenshot_data)
-            logger.info(f"Screenshot subido exitosamente: {screenshot_url}")
-        except Exception as e:
-            logger.error(f"Error subiendo screenshot a Drive: {e}")
-            # Continuar sin screenshot_url si falla la subida
-
-        # Evaluar diseño
+        # Evaluar diseño en paralelo con la captura y la subida: OpenAI evalúa
+        # directamente la URL de la página, no depende del screenshot
         logger.info(f"Estado de servicios - design_evaluator: {design_evaluator is not None}")
+        eval_task = None
+        if design_evaluator:
+            logger.info(f"Iniciando evaluación de diseño para: {url}")
+            eval_task = asyncio.create_task(asyncio.to_thread(design_evaluator.evaluate_design, url))
+
+        evaluation_id = None
+        upload_task = None
+        if screenshot_capture:
+            # Capturar screenshot (Selenium es bloqueante: se ejecuta en los hilos de captura)
+            logger.info(f"Capturando screenshot de {url}")
+            try:
+                screenshot_data = await asyncio.get_running_loop().run_in_executor(
+                    capture_executor, screenshot_capture.capture_screenshot, url
+                )
+            except Exception:
+                if eval_task:
+                    eval_task.cancel()
+                raise
+
+            # Subir screenshot a Google Drive en segundo plano: la respuesta no espera a Drive
+            logger.info("Subiendo screenshot a Google Drive en segundo plano...")
+            evaluation_id = uuid.uuid4().hex
+            upload_task = asyncio.create_task(upload_screenshot_to_drive(screenshot_data))
+            pending_uploads[evaluation_id] = upload_task
+            while len(pending_uploads) > MAX_PENDING_UPLOADS:
+                pending_uploads.popitem(last=False)
+
         evaluation_data = {"total_score": 50.0, "grade": "Regular", "categories": {}, "recommendations": ["Evaluación básica completada"]}
 
-        if design_evaluator:
+        if eval_task:
+            # Un fallo de la evaluación no afecta a la subida (y viceversa)
             try:
-                logger.info(f"Iniciando evaluación de diseño para: {url}")
-                # OpenAI evalúa directamente la URL de la página
-                evaluation_data = design_evaluator.evaluate_design(url)
+                evaluation_data = await eval_task
                 logger.info(f"Evaluación completada: {evaluation_data['total_score']}/100")
-                logger.info(f"Detalles evaluación: {evaluation_data}")
+                logger.debug("Detalles evaluación: %s", evaluation_data)
             except Exception as e:
-                logger.error(f"Error en evaluación de diseño: {e}")
-                import traceback
-                logger.error(f"Traceback completo: {traceback.format_exc()}")
+                logger.exception(f"Error en evaluación de diseño: {e}")
         else:
             logger.warning("Design evaluator no está disponible - usando evaluación básica")
 
-        # Registrar evaluación en Google Sheets
-        try:
-            logger.info("Registrando evaluación en Google Sheets...")
-            register_evaluation_in_sheets(url, evaluation_data, screenshot_url)
-            logger.info("Evaluación registrada exitosamente en Sheets")
-        except Exception as e:
-            logger.error(f"Error registrando en Sheets: {e}")
-            # Continuar aunque falle el registro en Sheets
+        # Registrar en Google Sheets en segundo plano, cuando termine la subida
+        if APPS_SCRIPT_URL:
+            registration = asyncio.create_task(register_when_uploaded(url, evaluation_data, upload_task))
+            pending_registrations.add(registration)
+            registration.add_done_callback(pending_registrations.discard)
+
+        # Esperar un tiempo acotado a la subida para incluir la URL del screenshot
+        # (la subida no se cancela: si no llega a tiempo sigue en segundo plano)
+        screenshot_url = None
+        if upload_task:
+            await asyncio.wait({upload_task}, timeout=SCREENSHOT_RESPONSE_WAIT)
+            if upload_task.done() and not upload_task.cancelled() and upload_task.exception() is None:
+                screenshot_url = upload_task.result()
 
         # Generar respuesta
         response = EvaluationResponse(
@@ -250,7 +601,8 @@ async def evaluate_website(request: EvaluationRequest):
             grade=evaluation_data['grade'],
             categories=evaluation_data['categories'],
             recommendations=evaluation_data.get('recommendations', []),
-            screenshot_url=screenshot_url
+            screenshot_url=screenshot_url,
+            evaluation_id=evaluation_id
         )
 
         return response
@@ -259,18 +611,23 @@ async def evaluate_website(request: EvaluationRequest):
         logger.error(f"Error procesando evaluación: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
+@app.get("/api/screenshots/{evaluation_id}")
+async def screenshot_status(evaluation_id: str):
+    """Consulta el estado de la subida del screenshot de una evaluación"""
+    upload_task = pending_uploads.get(evaluation_id)
+    if upload_task is None:
+        raise HTTPException(status_code=404, detail="Evaluación no encontrada")
+
+    if not upload_task.done():
+        return {"status": "pending", "screenshot_url": None}
+    if upload_task.cancelled() or upload_task.exception() is not None:
+        return {"status": "error", "screenshot_url": None}
+    return {"status": "done", "screenshot_url": upload_task.result()}
+
 @app.get("/api/health")
 async def health_check():
     """Verificación de salud del servicio"""
-    services_status = {
-        "screenshot_capture": screenshot_capture is not None,
-        "design_evaluator": design_evaluator is not None
-    }
-
-    return {
-        "status": "healthy" if all(services_status.values()) else "degraded",
-        "services": services_status
-    }
+    return health_payload or build_health_payload()
 
 @app.get("/favicon.ico")
 async def favicon():
@@ -284,4 +641,14 @@ async def manifest():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(
+        "backend.main:app",
+        host="0.0.0.0",
+        port=8000,
+        # "auto" usa uvloop y httptools si están instalados (uvloop no existe en Windows)
+        loop="auto",
+        http="auto",
+        # Las subidas pendientes y la caché de evaluaciones viven en memoria de
+        # cada proceso: un solo worker salvo que se indique lo contrario
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
\ No newline at end of file
@@ -1,24 +1,65 @@
 import os
+import base64
+import hashlib
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from chromedriver_py import binary_path
-from PIL import Image
-import io
+
+# Tamaño de ventana de las capturas
+WINDOW_SIZE = (1920, 1080)
+
+# Máximo de Chrome abiertos a la vez (capturas concurrentes); cada uno ocupa
+# cientos de MB, así que por defecto no más de 4
+DRIVER_POOL_SIZE = int(os.getenv('SCREENSHOT_POOL_SIZE', min(4, os.cpu_count() or 1)))
+
+# Las capturas se piden a Chrome en JPEG (sin el deflate del PNG)
+SCREENSHOT_FORMAT = "jpeg"
+SCREENSHOT_QUALITY = 85
+SCREENSHOT_EXTENSION = "jpg"
+
+# Escrituras a disco opcionales (output_path), fuera del hilo que captura
+_io_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="screenshot-io")
+
+def _write_bytes(path: str, data: bytes):
+    """Guarda los bytes de una captura en disco"""
+    try:
+        with open(path, 'wb') as f:
+            f.write(data)
+    except OSError as e:
+        print(f"Error guardando screenshot en {path}: {e}")
+
+class PageLoadError(Exception):
+    """La página no se pudo cargar (DNS, conexión...), pero Chrome sigue sano"""
 
 class ScreenshotCapture:
-    def __init__(self):
-        self.driver = None
+    def __init__(self, page_load_timeout: float = 10, pool_size: int = DRIVER_POOL_SIZE):
+        # Segundos máximos de espera a que la página termine de cargar
+        self.page_load_timeout = page_load_timeout
+
+        # Pool de Chrome reutilizables: se crean bajo demanda hasta pool_size y
+        # cada captura toma uno libre (o espera a que se libere)
+        self.pool_size = pool_size
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._idle_drivers = queue.LifoQueue()
+        self._drivers = []
+        self._lock = threading.Lock()
 
     def _setup_driver(self):
-        """Configura el driver de Chrome para captura de screenshots"""
+        """Configura un driver de Chrome para captura de screenshots"""
         chrome_options = Options()
         chrome_options.add_argument("--headless")  # Ejecutar en modo headless
         chrome_options.add_argument("--no-sandbox")
         chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--window-size=1920,1080")  # Resolución estándar
+        chrome_options.add_argument(f"--window-size={WINDOW_SIZE[0]},{WINDOW_SIZE[1]}")  # Resolución estándar
         chrome_options.add_argument("--disable-gpu")
         chrome_options.add_argument("--disable-extensions")
         chrome_options.add_argument("--disable-plugins")
@@ -29,135 +70,246 @@ class ScreenshotCapture:
         # Especificar la arquitectura correcta para Windows
         chrome_options.add_argument("--arch=x64")
 
+        # driver.get() vuelve con el DOM listo; el resto de la carga lo acota
+        # _load_page con page_load_timeout
+        chrome_options.page_load_strategy = "eager"
+
         try:
             # Usar chromedriver-py que incluye el binario
             service = Service(binary_path)
-            self.driver = webdriver.Chrome(service=service, options=chrome_options)
+            driver = webdriver.Chrome(service=service, options=chrome_options)
         except Exception as e:
             print(f"Error con chromedriver-py: {e}")
             # Fallback: intentar con webdriver-manager
             try:
+                # webdriver-manager solo se importa si hace falta el fallback
+                from webdriver_manager.chrome import ChromeDriverManager
                 service = Service(ChromeDriverManager().install())
-                self.driver = webdriver.Chrome(service=service, options=chrome_options)
+                driver = webdriver.Chrome(service=service, options=chrome_options)
             except Exception as e2:
                 print(f"Error con ChromeDriverManager fallback: {e2}")
                 raise Exception(f"No se pudo configurar ChromeDriver: {e2}")
 
-    def capture_screenshot(self, url: str, output_path: str = None) -> bytes:
-        """
-        Captura screenshot de la URL proporcionada
+        # Sin esto driver.get() puede bloquear hasta 300 s (valor por defecto de Selenium)
+        driver.set_page_load_timeout(self.page_load_timeout)
+        return driver
 
-        Args:
-            url (str): URL del sitio web
-            output_path (str, optional): Ruta para guardar la imagen localmente
+    def _discard_driver(self, driver):
+        """Cierra un driver inservible y lo saca del pool"""
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Error cerrando driver: {e}")
 
-        Returns:
-            bytes: Datos de la imagen en formato PNG
-        """
-        driver = None
+    @contextmanager
+    def _borrow_driver(self):
+        """Presta un driver del pool (creándolo si no hay ninguno libre) y lo devuelve limpio"""
+        self._slots.acquire()
         try:
-            # Crear un driver nuevo para cada captura
-            self._setup_driver()
-            driver = self.driver
+            try:
+                driver = self._idle_drivers.get_nowait()
+            except queue.Empty:
+                driver = self._setup_driver()
+                with self._lock:
+                    self._drivers.append(driver)
 
+            # Solo vuelve al pool un driver que terminó limpio o cuyo único fallo
+            # fue la página (URL inexistente, sin conexión...); cualquier otro
+            # error puede haber dejado Chrome inservible y se descarta
+            reusable = False
+            try:
+                yield driver
+                reusable = True
+            except PageLoadError:
+                reusable = True
+                raise
+            finally:
+                if reusable and self._clear_session(driver):
+                    self._idle_drivers.put(driver)
+                else:
+                    self._discard_driver(driver)
+        finally:
+            self._slots.release()
+
+    def _clear_session(self, driver) -> bool:
+        """Limpia cookies, almacenamiento y caché entre capturas para que no se contaminen"""
+        try:
+            # delete_all_cookies() solo borra las del dominio actual; por CDP se
+            # borran las de todos los dominios
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            # localStorage, IndexedDB... del origen capturado, antes de salir de
+            # la página; sessionStorage es de la pestaña y se borra aparte
+            origin = driver.execute_script(
+                "try { window.sessionStorage.clear(); } catch (e) {} return window.location.origin;"
+            )
+            if origin and origin != "null":
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+            driver.get("about:blank")
+            return True
+        except Exception as e:
+            print(f"Error limpiando sesión del driver, se recreará: {e}")
+            return False
+
+    def _load_page(self, driver, url: str):
+        """
+        Carga la URL y espera a document.readyState == 'complete', todo dentro de
+        page_load_timeout; si se agota se captura lo que haya cargado.
+        Los errores de navegación son de la página, no de Chrome (PageLoadError)
+        """
+        deadline = time.monotonic() + self.page_load_timeout
+        try:
+            # Con la estrategia "eager" vuelve en cuanto el DOM está listo
             driver.get(url)
-            # Esperar a que la página cargue completamente
-            time.sleep(3)
+        except TimeoutException:
+            print(f"Tiempo de carga agotado ({self.page_load_timeout}s), capturando de todos modos")
+            driver.execute_script("window.stop();")
+            return
+        except WebDriverException as e:
+            if "net::ERR_" in (e.msg or ""):
+                raise PageLoadError(e.msg) from e
+            raise
 
-            # Capturar screenshot
-            screenshot = driver.get_screenshot_as_png()
+        try:
+            WebDriverWait(driver, max(0.0, deadline - time.monotonic()), poll_frequency=0.1).until(
+                lambda d: d.execute_script("return document.readyState") == "complete"
+            )
+        except TimeoutException:
+            # Recursos que nunca terminan de cargar: se captura lo que haya
+            print(f"Tiempo de carga agotado ({self.page_load_timeout}s), capturando de todos modos")
 
-            # # Guardar automáticamente en la carpeta screenshots para control
-            # if not output_path:
-            #     # Crear nombre de archivo basado en la URL y timestamp
-            #     import hashlib
-            #     import datetime
-            #     url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
-            #     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            #     output_path = f"screenshots/screenshot_{url_hash}_{timestamp}.png"
+    def _take_screenshot(self, driver, clip: dict = None) -> bytes:
+        """
+        Captura en JPEG mediante CDP Page.captureScreenshot
 
-            # # Guardar localmente
-            # with open(output_path, 'wb') as f:
-            #     f.write(screenshot)
+        Args:
+            driver: Driver de Chrome
+            clip (dict, optional): Región a capturar; si se indica se renderiza
+                también fuera del viewport, sin redimensionar la ventana
+        """
+        params = {"format": SCREENSHOT_FORMAT, "quality": SCREENSHOT_QUALITY}
+        if clip:
+            params["captureBeyondViewport"] = True
+            params["clip"] = clip
+        result = driver.execute_cdp_cmd("Page.captureScreenshot", params)
+        return base64.b64decode(result["data"])
 
-            return screenshot
+    def _persist(self, url: str, data: bytes, prefix: str, output_path: str = None):
+        """
+        Guarda una captura en disco en segundo plano, solo si se pidió output_path
 
-        except Exception as e:
-            raise Exception(f"Error al capturar screenshot de {url}: {str(e)}")
-        finally:
-            # Cerrar el driver después de cada uso
-            if driver:
-                try:
-                    driver.quit()
-                except Exception as e:
-                    print(f"Error cerrando driver: {e}")
-                self.driver = None
+        Args:
+            url (str): URL capturada (para nombrar el archivo)
+            data (bytes): Imagen capturada
+            prefix (str): Prefijo del nombre de archivo si output_path es un directorio
+            output_path (str, optional): Archivo o directorio de destino
+        """
+        if not output_path:
+            return
 
-    def capture_full_page(self, url: str, output_path: str = None) -> bytes:
+        if os.path.isdir(output_path):
+            # Nombre basado en la URL y la hora de captura
+            url_hash = hashlib.blake2b(url.encode(), digest_size=4).hexdigest()
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            output_path = os.path.join(output_path, f"{prefix}_{url_hash}_{timestamp}.{SCREENSHOT_EXTENSION}")
+
+        _io_executor.submit(_write_bytes, output_path, data)
+
+    def reset(self):
+        """Cierra los drivers libres (por ejemplo, si Chrome dejó de responder); se recrean al usarse"""
+        while True:
+            try:
+                driver = self._idle_drivers.get_nowait()
+            except queue.Empty:
+                break
+            self._discard_driver(driver)
+
+    def capture_screenshot(self, url: str, output_path: str = None) -> bytes:
         """
-        Captura screenshot de página completa (scroll)
+        Captura screenshot de la URL proporcionada
 
         Args:
             url (str): URL del sitio web
-            output_path (str, optional): Ruta para guardar la imagen
+            output_path (str, optional): Archivo o directorio donde guardar la imagen
+                localmente (solo se escribe si se indica, en segundo plano)
 
         Returns:
-            bytes: Datos de la imagen completa
+            bytes: Datos de la imagen en formato JPEG
         """
-        driver = None
         try:
-            # Crear un driver nuevo para cada captura
-            self._setup_driver()
-            driver = self.driver
-
-            driver.get(url)
-            time.sleep(3)
+            with self._borrow_driver() as driver:
+                screenshot = self._capture(driver, url)
+            self._persist(url, screenshot, "screenshot", output_path)
+            return screenshot
+        except Exception as e:
+            raise Exception(f"Error al capturar screenshot de {url}: {str(e)}")
 
-            # Obtener dimensiones totales de la página
-            total_width = driver.execute_script("return document.body.scrollWidth")
-            total_height = driver.execute_script("return document.body.scrollHeight")
+    def _capture(self, driver, url: str) -> bytes:
+        """Carga la URL en el driver prestado y captura la ventana"""
+        # Esperar a que la página cargue completamente
+        self._load_page(driver, url)
 
-            # Configurar ventana al tamaño total
-            driver.set_window_size(total_width, total_height)
+        # Capturar screenshot
+        screenshot = self._take_screenshot(driver)
 
-            # Capturar screenshot completo
-            screenshot = driver.get_screenshot_as_png()
+        return screenshot
 
-            # # Guardar automáticamente en la carpeta screenshots para control
-            # if not output_path:
-            #     # Crear nombre de archivo basado en la URL y timestamp
-            #     import hashlib
-            #     import datetime
-            #     url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
-            #     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            #     output_path = f"screenshots/fullpage_{url_hash}_{timestamp}.png"
+    def capture_full_page(self, url: str, output_path: str = None) -> bytes:
+        """
+        Captura screenshot de página completa (scroll)
 
-            # # Guardar localmente
-            # with open(output_path, 'wb') as f:
-            #     f.write(screenshot)
+        Args:
+            url (str): URL del sitio web
+            output_path (str, optional): Archivo o directorio donde guardar la imagen
+                (solo se escribe si se indica, en segundo plano)
 
+        Returns:
+            bytes: Datos de la imagen completa en formato JPEG
+        """
+        try:
+            with self._borrow_driver() as driver:
+                screenshot = self._capture_full_page(driver, url)
+            self._persist(url, screenshot, "fullpage", output_path)
             return screenshot
-
         except Exception as e:
             raise Exception(f"Error al capturar página completa de {url}: {str(e)}")
-        finally:
-            # Cerrar el driver después de cada uso
-            if driver:
-                try:
-                    driver.quit()
-                except Exception as e:
-                    print(f"Error cerrando driver: {e}")
-                self.driver = None
+
+    def _capture_full_page(self, driver, url: str) -> bytes:
+        """Carga la URL en el driver prestado y captura la página completa"""
+        self._load_page(driver, url)
+
+        # Obtener dimensiones totales del documento
+        content_size = driver.execute_cdp_cmd("Page.getLayoutMetrics", {})["cssContentSize"]
+
+        # Capturar el documento completo sin redimensionar la ventana (evita un re-layout)
+        screenshot = self._take_screenshot(driver, clip={
+            "x": 0,
+            "y": 0,
+            "width": content_size["width"],
+            "height": content_size["height"],
+            "scale": 1
+        })
+
+        return screenshot
 
     def close(self):
-        """Cierra el driver del navegador"""
-        if self.driver:
+        """Cierra todos los drivers del navegador"""
+        while True:
+            try:
+                self._idle_drivers.get_nowait()
+            except queue.Empty:
+                break
+
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+        for driver in drivers:
             try:
-                self.driver.quit()
+                driver.quit()
             except Exception as e:
                 print(f"Error cerrando driver: {e}")
-            finally:
-                self.driver = None
 
     def __enter__(self):
         return self
@@ -1,15 +1,23 @@
 // Google Apps Script para registrar evaluaciones en Google Sheets y subir screenshots
 // Este script debe ser publicado como web app con acceso público
 
+// IDs configurables en las propiedades del script (SPREADSHEET_ID, DRIVE_FOLDER_ID);
+// si no están definidas se usan los valores por defecto
+var SCRIPT_PROPERTIES = PropertiesService.getScriptProperties();
+var SPREADSHEET_ID = SCRIPT_PROPERTIES.getProperty('SPREADSHEET_ID') || '1Nke_o3A7WdyXKv8Lr9pJv4gpIxBnX0Q3CQCvHn_bOgw';
+var DRIVE_FOLDER_ID = SCRIPT_PROPERTIES.getProperty('DRIVE_FOLDER_ID') || '1_Z1vE6Ekg_8-AgEbIcoPsvjitj7_MKyB';
+
 function doPost(e) {
   try {
-    // Log para debugging
-    Logger.log('doPost called with e: ' + JSON.stringify(e));
+    // Log para debugging (sin serializar el cuerpo: puede ser una imagen completa)
     Logger.log('e exists: ' + (e ? 'YES' : 'NO'));
     Logger.log('e.postData exists: ' + (e && e.postData ? 'YES' : 'NO'));
+    if (e) {
+      Logger.log('e.parameter: ' + JSON.stringify(e.parameter));
+    }
     if (e && e.postData) {
-      Logger.log('e.postData.contents exists: ' + (e.postData.contents ? 'YES' : 'NO'));
-      Logger.log('e.postData.contents length: ' + (e.postData.contents ? e.postData.contents.length : 0));
+      Logger.log('e.postData.type: ' + e.postData.type);
+      Logger.log('e.postData.length: ' + e.postData.length);
     }
 
     // Verificar que e existe y tiene postData
@@ -28,6 +36,18 @@ function doPost(e) {
       throw new Error('postData.contents is empty');
     }
 
+    // Subida de screenshot como texto base64 plano (tipo MIME en la query string)
+    if (e.parameter && e.parameter.mime_type) {
+      Logger.log('Handling raw base64 screenshot upload');
+      Logger.log('Base64 body length: ' + e.postData.contents.length);
+
+      var rawUrl = saveScreenshot(Utilities.base64Decode(e.postData.contents), e.parameter.mime_type);
+
+      return ContentService
+        .createTextOutput(JSON.stringify({ success: true, url: rawUrl }))
+        .setMimeType(ContentService.MimeType.JSON);
+    }
+
     // Obtener datos del POST
     const data = JSON.parse(e.postData.contents);
 
@@ -36,48 +56,20 @@ function doPost(e) {
       // Manejar subida de screenshot
       Logger.log('Handling screenshot upload');
 
-      try {
-        var base64Data = data.image_base64; // Ejemplo: 'data:image/png;base64,iVBORw0...'
-        Logger.log('Base64 data length: ' + base64Data.length);
-
-        var matches = base64Data.match(/^data:(.+);base64,(.+)$/);
-        if (!matches) {
-          throw new Error('Formato de imagen base64 inválido');
-        }
+      var base64Data = data.image_base64; // Ejemplo: 'data:image/png;base64,iVBORw0...'
+      Logger.log('Base64 data length: ' + base64Data.length);
 
-        var contentType = matches[1];
-        var base64String = matches[2];
-        Logger.log('Content type: ' + contentType);
-        Logger.log('Base64 string length: ' + base64String.length);
-
-        var bytes = Utilities.base64Decode(base64String);
-        Logger.log('Decoded bytes length: ' + bytes.length);
-
-        var blob = Utilities.newBlob(bytes, contentType, 'screenshot.png');
-        Logger.log('Blob created successfully');
-
-        // Carpeta destino
-        var folderId = '1_Z1vE6Ekg_8-AgEbIcoPsvjitj7_MKyB';
-        Logger.log('Attempting to get folder with ID: ' + folderId);
-
-        var folder = DriveApp.getFolderById(folderId);
-        Logger.log('Folder obtained successfully: ' + folder.getName());
-
-        var file = folder.createFile(blob);
-        Logger.log('File created successfully: ' + file.getName());
-
-        file.setSharing(DriveApp.Access.ANYONE_WITH_LINK, DriveApp.Permission.VIEW);
-        Logger.log('File sharing set successfully');
+      var matches = base64Data.match(/^data:(.+);base64,(.+)$/);
+      if (!matches) {
+        throw new Error('Formato de imagen base64 inválido');
+      }
 
-        // Construir URL de visualización directa usando el file ID (para mostrar en web)
-        var fileId = file.getId();
-        var downloadUrl = 'https://drive.google.com/uc?export=view&id=' + fileId;
-        Logger.log('Screenshot uploaded successfully: ' + downloadUrl);
+      var contentType = matches[1];
+      var base64String = matches[2];
+      Logger.log('Content type: ' + contentType);
+      Logger.log('Base64 string length: ' + base64String.length);
 
-      } catch (uploadError) {
-        Logger.log('Error during screenshot upload: ' + uploadError.toString());
-        throw uploadError; // Re-throw to be caught by outer try-catch
-      }
+      var downloadUrl = saveScreenshot(Utilities.base64Decode(base64String), contentType);
 
       return ContentService
         .createTextOutput(JSON.stringify({ success: true, url: downloadUrl }))
@@ -86,59 +78,65 @@ function doPost(e) {
       // Manejar registro de evaluación en Sheets
       Logger.log('Handling evaluation logging');
 
-      // Verificar que los datos necesarios estén presentes
-      if (!data.url || data.total_score === undefined || data.total_score === null) {
-        throw new Error('Datos insuficientes para registrar evaluación: url y total_score son requeridos');
+      // Aceptar una sola evaluación o un lote en data.rows
+      const evaluations = Array.isArray(data.rows) ? data.rows : [data];
+      Logger.log('Evaluations received: ' + evaluations.length);
+      if (evaluations.length === 0) {
+        throw new Error('No hay evaluaciones para registrar');
       }
 
+      // Verificar que los datos necesarios estén presentes
+      evaluations.forEach(function(evaluation) {
+        if (!evaluation.url || evaluation.total_score === undefined || evaluation.total_score === null) {
+          throw new Error('Datos insuficientes para registrar evaluación: url y total_score son requeridos');
+        }
+      });
+
       // Obtener la hoja de cálculo por ID
-      const spreadsheet = SpreadsheetApp.openById('1Nke_o3A7WdyXKv8Lr9pJv4gpIxBnX0Q3CQCvHn_bOgw');
+      const spreadsheet = SpreadsheetApp.openById(SPREADSHEET_ID);
       if (!spreadsheet) {
         throw new Error('No se pudo abrir la hoja de cálculo');
       }
       Logger.log('Spreadsheet ID: ' + spreadsheet.getId());
 
-      // Obtener o crear la hoja 'Evaluaciones'
-      let sheet = spreadsheet.getSheetByName('Evaluaciones');
-      if (!sheet) {
-        Logger.log('Creating new sheet: Evaluaciones');
-        sheet = spreadsheet.insertSheet('Evaluaciones');
-
-        // Agregar headers
-        const headers = [
-          'Timestamp',
-          'URL',
-          'Puntaje Total',
-          'Calificación',
-          'Tipografía',
-          'Color',
-          'Layout',
-          'Usabilidad',
-          'Screenshot URL',
-          'Recomendaciones'
-        ];
-        sheet.appendRow(headers);
-        Logger.log('Headers added to new sheet');
-      }
+      // Preparar filas de datos
+      const rows = evaluations.map(buildEvaluationRow);
+      Logger.log('Rows to append: ' + JSON.stringify(rows));
+
+      // Leer getLastRow() y escribir debe ser atómico: dos ejecuciones
+      // concurrentes de doPost podrían sobrescribir las filas de la otra
+      const lock = LockService.getScriptLock();
+      lock.waitLock(30000);
+      try {
+        // Obtener o crear la hoja 'Evaluaciones'
+        let sheet = spreadsheet.getSheetByName('Evaluaciones');
+        if (!sheet) {
+          Logger.log('Creating new sheet: Evaluaciones');
+          sheet = spreadsheet.insertSheet('Evaluaciones');
+
+          // Agregar headers
+          const headers = [
+            'Timestamp',
+            'URL',
+            'Puntaje Total',
+            'Calificación',
+            'Tipografía',
+            'Color',
+            'Layout',
+            'Usabilidad',
+            'Screenshot URL',
+            'Recomendaciones'
+          ];
+          sheet.appendRow(headers);
+          Logger.log('Headers added to new sheet');
+        }
 
-      // Preparar fila de datos
-      const rowData = [
-        data.timestamp || new Date().toISOString(),
-        data.url || '',
-        data.total_score || 0,
-        data.grade || '',
-        data.typography_score || 0,
-        data.color_score || 0,
-        data.layout_score || 0,
-        data.usability_score || 0,
-        data.screenshot_url || '',
-        data.recommendations ? data.recommendations.join('; ') : ''
-      ];
-
-      Logger.log('Row data to append: ' + JSON.stringify(rowData));
-
-      // Agregar fila a la hoja
-      sheet.appendRow(rowData);
+        // Agregar todas las filas a la hoja con una sola escritura
+        sheet.getRange(sheet.getLastRow() + 1, 1, rows.length, rows[0].length).setValues(rows);
+        SpreadsheetApp.flush();
+      } finally {
+        lock.releaseLock();
+      }
 
       Logger.log('Evaluation logged successfully');
 
@@ -147,6 +145,7 @@ function doPost(e) {
         .createTextOutput(JSON.stringify({
           success: true,
           message: 'Evaluación registrada exitosamente',
+          rows: rows.length,
           timestamp: new Date().toISOString()
         }))
         .setMimeType(ContentService.MimeType.JSON);
@@ -165,6 +164,56 @@ function doPost(e) {
   }
 }
 
+function buildEvaluationRow(data) {
+  // Convierte una evaluación en una fila de la hoja 'Evaluaciones'
+  return [
+    data.timestamp || new Date().toISOString(),
+    data.url || '',
+    data.total_score || 0,
+    data.grade || '',
+    data.typography_score || 0,
+    data.color_score || 0,
+    data.layout_score || 0,
+    data.usability_score || 0,
+    data.screenshot_url || '',
+    data.recommendations ? data.recommendations.join('; ') : ''
+  ];
+}
+
+function saveScreenshot(bytes, contentType) {
+  // Guarda los bytes del screenshot en Drive y devuelve la URL pública
+  try {
+    Logger.log('Decoded bytes length: ' + bytes.length);
+
+    var extension = contentType === 'image/jpeg' ? 'jpg' : 'png';
+    var blob = Utilities.newBlob(bytes, contentType, 'screenshot.' + extension);
+    Logger.log('Blob created successfully');
+
+    // Carpeta destino
+    var folderId = DRIVE_FOLDER_ID;
+    Logger.log('Attempting to get folder with ID: ' + folderId);
+
+    var folder = DriveApp.getFolderById(folderId);
+    Logger.log('Folder obtained successfully: ' + folder.getName());
+
+    var file = folder.createFile(blob);
+    Logger.log('File created successfully: ' + file.getName());
+
+    file.setSharing(DriveApp.Access.ANYONE_WITH_LINK, DriveApp.Permission.VIEW);
+    Logger.log('File sharing set successfully');
+
+    // Construir URL de visualización directa usando el file ID (para mostrar en web)
+    var fileId = file.getId();
+    var downloadUrl = 'https://drive.google.com/uc?export=view&id=' + fileId;
+    Logger.log('Screenshot uploaded successfully: ' + downloadUrl);
+
+    return downloadUrl;
+  } catch (uploadError) {
+    Logger.log('Error during screenshot upload: ' + uploadError.toString());
+    throw uploadError; // Re-throw to be caught by doPost
+  }
+}
+
 function doGet(e) {
   // Endpoint GET para verificar que el script funciona
   return ContentService
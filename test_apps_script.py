@@ -4,12 +4,19 @@ Script de prueba para probar el endpoint del Google Apps Script
 con subida de screenshots
 """
 
+import os
 import requests
 import base64
 import json
 from PIL import Image, ImageDraw
 import io
 
+# URL del Apps Script (la misma del .env)
+APPS_SCRIPT_URL = "https://script.google.com/macros/s/AKfycbwzdcTEzcs7aNV-JXFh-C4oqNrNA_GNfAmu_WCTwOZjfpmHlliAFP2b_ockFnkd6olY/exec"
+
+# VERBOSE=1 muestra payloads y cabeceras completas (lento con imágenes grandes)
+VERBOSE = os.getenv('VERBOSE', '').lower() in ('1', 'true', 'yes')
+
 def create_test_image():
     """Crea una imagen de prueba simple"""
     # Crear una imagen de 100x100 píxeles
@@ -29,14 +36,11 @@ def create_test_image():
 def test_apps_script_upload():
     """Prueba la subida de imagen al Apps Script"""
 
-    # URL del Apps Script desde el .env
-    apps_script_url = "https://script.google.com/macros/s/AKfycbwzdcTEzcs7aNV-JXFh-C4oqNrNA_GNfAmu_WCTwOZjfpmHlliAFP2b_ockFnkd6olY/exec"
-
     # Crear imagen de prueba
     image_data = create_test_image()
     print(f"Tamaño de imagen de prueba: {len(image_data)} bytes")
 
-    # Convertir a base64 con formato data URL
+    # Convertir a base64 con formato data URL (una sola vez)
     base64_data = base64.b64encode(image_data).decode('utf-8')
     data_url = f"data:image/png;base64,{base64_data}"
 
@@ -46,20 +50,22 @@ def test_apps_script_upload():
     }
 
     print(f"Enviando payload con image_base64 de longitud: {len(data_url)}")
-    print(f"Payload keys: {list(payload.keys())}")
-    print(f"Primeros 100 caracteres de image_base64: {data_url[:100]}")
+    if VERBOSE:
+        print(f"Payload keys: {list(payload.keys())}")
+        print(f"Primeros 100 caracteres de image_base64: {data_url[:100]}")
 
     try:
         # Enviar POST
         response = requests.post(
-            apps_script_url,
+            APPS_SCRIPT_URL,
             json=payload,
             headers={'Content-Type': 'application/json'},
             timeout=30
         )
 
         print(f"Status code: {response.status_code}")
-        print(f"Response headers: {dict(response.headers)}")
+        if VERBOSE:
+            print(f"Response headers: {dict(response.headers)}")
 
         if response.status_code == 200:
             try:
@@ -81,11 +87,42 @@ def test_apps_script_upload():
     except requests.RequestException as e:
         print(f"Error de conexión: {e}")
 
+def test_apps_script_raw_upload():
+    """Prueba la subida como la hace el backend: base64 plano con el tipo MIME en la query string"""
+
+    image_data = create_test_image()
+    body = base64.b64encode(image_data)
+    print(f"Enviando cuerpo base64 plano de longitud: {len(body)}")
+
+    try:
+        response = requests.post(
+            APPS_SCRIPT_URL,
+            params={'mime_type': 'image/png'},
+            data=body,
+            headers={'Content-Type': 'text/plain'},
+            timeout=30
+        )
+
+        print(f"Status code: {response.status_code}")
+
+        if response.status_code == 200:
+            result = response.json()
+            print(f"Respuesta JSON: {json.dumps(result, indent=2)}")
+
+            if result.get('success'):
+                print(f"EXITO! URL del archivo: {result.get('url')}")
+            else:
+                print(f"ERROR en Apps Script: {result.get('error')}")
+        else:
+            print(f"Error HTTP {response.status_code}")
+            print(f"Respuesta: {response.text}")
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+
 def test_apps_script_logging():
     """Prueba el registro en Sheets (sin imagen)"""
 
-    apps_script_url = "https://script.google.com/macros/s/AKfycbwzdcTEzcs7aNV-JXFh-C4oqNrNA_GNfAmu_WCTwOZjfpmHlliAFP2b_ockFnkd6olY/exec"
-
     # Payload para registro en Sheets
     payload = {
         'timestamp': '2025-01-01T12:00:00Z',
@@ -101,11 +138,12 @@ def test_apps_script_logging():
     }
 
     print("Probando registro en Sheets...")
-    print(f"Payload: {json.dumps(payload, indent=2)}")
+    if VERBOSE:
+        print(f"Payload: {json.dumps(payload, indent=2)}")
 
     try:
         response = requests.post(
-            apps_script_url,
+            APPS_SCRIPT_URL,
             json=payload,
             headers={'Content-Type': 'application/json'},
             timeout=10
@@ -125,20 +163,74 @@ def test_apps_script_logging():
     except Exception as e:
         print(f"❌ Error: {e}")
 
+def test_apps_script_batch_logging():
+    """Prueba el registro en Sheets de un lote de filas ({'rows': [...]}), como lo envía el backend"""
+
+    payload = {
+        'rows': [
+            {
+                'timestamp': '2025-01-01T12:00:00Z',
+                'url': 'https://example.com',
+                'total_score': 85.5,
+                'grade': 'Excelente',
+                'recommendations': ['Recomendación 1']
+            },
+            {
+                'timestamp': '2025-01-01T12:00:01Z',
+                'url': 'https://example.org',
+                'total_score': 62.0,
+                'grade': 'Bueno',
+                'recommendations': ['Recomendación 2']
+            }
+        ]
+    }
+
+    print(f"Probando registro en Sheets de un lote de {len(payload['rows'])} filas...")
+    if VERBOSE:
+        print(f"Payload: {json.dumps(payload, indent=2)}")
+
+    try:
+        response = requests.post(
+            APPS_SCRIPT_URL,
+            json=payload,
+            headers={'Content-Type': 'application/json'},
+            timeout=10
+        )
+
+        print(f"Status code: {response.status_code}")
+
+        if response.status_code == 200:
+            result = response.json()
+            print(f"Respuesta: {json.dumps(result, indent=2)}")
+
+            if result.get('success') and result.get('rows') == len(payload['rows']):
+                print("Registro del lote en Sheets exitoso!")
+            else:
+                print(f"Error en registro del lote: {result.get('error', result)}")
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+
 if __name__ == "__main__":
     print("=== Probando subida de imagen al Apps Script ===")
     test_apps_script_upload()
 
+    print("\n=== Probando subida en base64 plano (formato del backend) ===")
+    test_apps_script_raw_upload()
+
     print("\n=== Probando registro en Sheets ===")
     test_apps_script_logging()
 
+    print("\n=== Probando registro en Sheets por lotes (formato del backend) ===")
+    test_apps_script_batch_logging()
+
     print("\n=== Comando cURL para probar manualmente ===")
     print("Para probar la subida de imagen:")
-    print('''curl -X POST "https://script.google.com/macros/s/AKfycbwzdcTEzcs7aNV-JXFh-C4oqNrNA_GNfAmu_WCTwOZjfpmHlliAFP2b_ockFnkd6olY/exec" \\
+    print('curl -X POST "' + APPS_SCRIPT_URL + '''" \\
   -H "Content-Type: application/json" \\
   -d '{"image_base64":"data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAGQAAABkCAIAAAD/gAIDAAABo0lEQVR4nO3bUU7DQBAEUYy4/5XDh3"}' ''')
 
     print("\nPara probar el registro en Sheets:")
-    print('''curl -X POST "https://script.google.com/macros/s/AKfycbwzdcTEzcs7aNV-JXFh-C4oqNrNA_GNfAmu_WCTwOZjfpmHlliAFP2b_ockFnkd6olY/exec" \\
+    print('curl -X POST "' + APPS_SCRIPT_URL + '''" \\
   -H "Content-Type: application/json" \\
   -d '{"url":"https://example.com","total_score":85.5}' ''')
\ No newline at end of file